@@ -4,7 +4,10 @@
 import asyncio
 import logging
 import os
+import re
+from collections import deque
 from datetime import datetime, timedelta
+from cachetools import TTLCache
 from pyrogram import Client
 from pyrogram.types import Message
 from .openai_integration import OpenAIIntegration
@@ -12,6 +15,9 @@ from .google_calendar_integration import GoogleCalendarIntegration
 
 logger = logging.getLogger(__name__)
 
+# Номер слота в тексте клиента (клиенту показывается не больше 10 слотов)
+_SLOT_RE = re.compile(r'\b([1-9]|10)\b')
+
 
 class ConsultantBot:
     """
@@ -19,6 +25,9 @@ class ConsultantBot:
     и может назначать встречи в Google Meet.
     """
 
+    # Окно ожидания для склейки серии коротких сообщений (секунды)
+    BATCH_WINDOW = 1.5
+
     def __init__(self, phone_number, api_id, api_hash, openai_api_key, consultation_topic):
         """
         Инициализация бота-консультанта.
@@ -36,11 +45,14 @@ class ConsultantBot:
         self.openai_api_key = openai_api_key
         self.consultation_topic = consultation_topic
 
-        # Инициализация клиента Telegram
+        # Инициализация клиента Telegram. TgCrypto (см. requirements.txt)
+        # подхватывается Pyrogram автоматически: нативная реализация AES-IGE
+        # шифрует каждый пакет MTProto на порядки быстрее чистого Python
         self.app = Client(
             "consultant_bot",
             api_id=api_id,
-            api_hash=api_hash
+            api_hash=api_hash,
+            workers=max(8, (os.cpu_count() or 4) * 2)
         )
 
         # Инициализация интеграции с OpenAI
@@ -49,12 +61,25 @@ class ConsultantBot:
         # Инициализация интеграции с Google Calendar
         self.calendar = GoogleCalendarIntegration()
 
-        # Для отслеживания контекста беседы
-        self.conversation_context = {}
+        # Кэш найденного контакта клиента: адресная книга загружается
+        # один раз, обработка входящих сообщений обходится без запросов
+        self._target_contact = None
+        self._target_user_id = None
+
+        # Накопленные, но еще не обработанные сообщения по пользователям
+        self._pending = {}
+
+        # Для отслеживания контекста беседы. Ограниченный кэш с TTL:
+        # мертвые диалоги вытесняются через час, память не растет бесконечно
+        self.conversation_context = TTLCache(maxsize=10_000, ttl=3600)
 
         # Флаг для обозначения, что бот работает
         self.is_running = False
 
+        # Событие остановки и цикл событий бота (создаются в _start)
+        self._stop_event = None
+        self._loop = None
+
         # Функция обратного вызова для логирования
         self.log_callback = None
 
@@ -72,7 +97,7 @@ class ConsultantBot:
         """Отправка первоначального сообщения клиенту."""
         try:
             # Получение контакта клиента
-            contact = await self._get_contact_by_phone(self.phone_number)
+            contact = await self._resolve_target_user_id()
             if not contact:
                 self._log(f"Контакт с номером {self.phone_number} не найден")
                 return False
@@ -90,12 +115,23 @@ class ConsultantBot:
             self._log(f"Ошибка при отправке начального сообщения: {e}")
             return False
 
-    async def _get_contact_by_phone(self, phone):
-        """Получение контакта по номеру телефона."""
+    async def _resolve_target_user_id(self):
+        """
+        Однократное определение контакта клиента по номеру телефона.
+
+        Загружает адресную книгу один раз и кэширует найденный контакт
+        и его ID, чтобы обработчик входящих сообщений сравнивал ID
+        напрямую, без сетевого запроса и перебора контактов.
+
+        Returns:
+            Contact: Найденный контакт или None
+        """
         try:
-            # Поиск контакта по номеру телефона
+            if self._target_contact is not None:
+                return self._target_contact
+
             # Форматируем номер телефона, убирая все нецифровые символы
-            formatted_phone = ''.join(filter(str.isdigit, phone))
+            formatted_phone = ''.join(filter(str.isdigit, self.phone_number))
 
             # Получаем все контакты из адресной книги
             contacts = await self.app.get_contacts()
@@ -104,6 +140,8 @@ class ConsultantBot:
             for contact in contacts:
                 contact_phone = ''.join(filter(str.isdigit, contact.phone_number))
                 if contact_phone.endswith(formatted_phone[-10:]):
+                    self._target_contact = contact
+                    self._target_user_id = contact.id
                     return contact
 
             return None
@@ -112,6 +150,54 @@ class ConsultantBot:
             self._log(f"Ошибка при поиске контакта: {e}")
             return None
 
+    async def _enqueue_message(self, message):
+        """
+        Накопление серии сообщений пользователя перед обработкой.
+
+        Несколько коротких сообщений, отправленных подряд, склеиваются
+        в одно обращение к GPT вместо отдельного запроса на каждое.
+
+        Args:
+            message (Message): Входящее сообщение
+        """
+        user_id = message.from_user.id
+
+        pending = self._pending.get(user_id)
+        if pending is None:
+            pending = {"texts": [], "message": message, "task": None}
+            self._pending[user_id] = pending
+
+        pending["texts"].append(message.text)
+        pending["message"] = message
+
+        # Продлеваем окно ожидания, если новое сообщение пришло до истечения
+        if pending["task"] is not None:
+            pending["task"].cancel()
+        pending["task"] = asyncio.create_task(self._flush_after(user_id, self.BATCH_WINDOW))
+
+    async def _flush_after(self, user_id, delay):
+        """
+        Обработка накопленных сообщений после паузы в переписке.
+
+        Args:
+            user_id (int): ID пользователя
+            delay (float): Пауза перед обработкой в секундах
+        """
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            return
+
+        pending = self._pending.pop(user_id, None)
+        if not pending:
+            return
+
+        # Склеиваем серию сообщений в одно
+        message = pending["message"]
+        message.text = "\n".join(pending["texts"])
+
+        await self.process_message(message)
+
     async def process_message(self, message):
         """
         Обработка входящего сообщения от клиента.
@@ -126,7 +212,9 @@ class ConsultantBot:
             # Если это новый диалог, инициализируем контекст
             if user_id not in self.conversation_context:
                 self.conversation_context[user_id] = {
-                    "messages": [],
+                    # deque с maxlen сам вытесняет старые сообщения:
+                    # O(1)-добавление и ограничение истории одним механизмом
+                    "messages": deque(maxlen=20),
                     "meeting_scheduling": False,
                     "available_slots": []
                 }
@@ -141,54 +229,45 @@ class ConsultantBot:
 
             # Если мы находимся в процессе назначения встречи
             if context.get("meeting_scheduling"):
-                # Проверяем, выбрал ли клиент временной слот
+                # Проверяем, указал ли клиент номер слота
                 selected_slot = self._check_if_slot_selected(message.text, context["available_slots"])
 
                 if selected_slot:
-                    # Создаем встречу в Google Calendar
-                    meet_link = await self.calendar.create_meeting(
-                        self.consultation_topic,
-                        selected_slot["start"],
-                        selected_slot["end"]
-                    )
-
-                    # Отправляем ссылку на встречу
-                    response = f"Отлично! Я создал встречу на {selected_slot['start_str']}. "
-                    response += f"Вот ссылка для подключения: {meet_link}"
-
-                    await self.app.send_message(user_id, response)
-
-                    # Сбрасываем флаг назначения встречи
-                    context["meeting_scheduling"] = False
-                    context["available_slots"] = []
-
-                    # Добавляем ответ в контекст
-                    context["messages"].append({
-                        "role": "assistant",
-                        "content": response
-                    })
-
+                    await self._book_slot(user_id, context, selected_slot)
                     return
 
-            # Определяем, есть ли намерение назначить встречу
-            meeting_intent = await self.openai.detect_meeting_intent(message.text)
+            # Определяем намерение (и ответ) и параллельно запрашиваем
+            # доступные слоты: это независимые I/O-запросы, так что ожидание
+            # Calendar скрывается за временем ответа GPT. Если намерения нет,
+            # результат поиска слотов просто отбрасывается.
+            (meeting_intent, response), available_slots = await asyncio.gather(
+                self.openai.get_response_with_intent(context["messages"]),
+                self.calendar.get_available_slots(days=5, duration_minutes=30)
+            )
 
             if meeting_intent and not context.get("meeting_scheduling"):
-                # Получаем доступные слоты для встречи на ближайшие 5 дней
-                available_slots = await self.calendar.get_available_slots(days=5, duration_minutes=30)
-
                 if available_slots:
-                    # Форматируем слоты для отображения
-                    slots_text = "\n".join([f"{i + 1}. {slot['start_str']}" for i, slot in enumerate(available_slots)])
-                    response = f"Я могу назначить видеовстречу для более детального обсуждения. Вот доступные временные слоты:\n\n{slots_text}\n\nПожалуйста, выберите номер удобного для вас временного слота."
+                    # Нумерованный список слотов текстом: клиент отвечает
+                    # номером. Inline-кнопки здесь недоступны - клиент
+                    # Telegram работает от имени пользователя, а кнопки
+                    # и callback-запросы Telegram отдает только ботам
+                    slots_text = "\n".join(
+                        f"{i}. {slot['start_str']}"
+                        for i, slot in enumerate(available_slots, 1)
+                    )
+                    response = (
+                        "Я могу назначить видеовстречу для более детального обсуждения. "
+                        f"Вот доступные временные слоты:\n\n{slots_text}\n\n"
+                        "Пожалуйста, укажите номер подходящего слота."
+                    )
 
                     # Сохраняем доступные слоты в контексте
                     context["meeting_scheduling"] = True
                     context["available_slots"] = available_slots
                 else:
                     response = "К сожалению, на ближайшие дни нет доступных временных слотов для встречи. Могу я помочь вам с чем-то еще?"
-            else:
-                # Получаем ответ от GPT
+            elif response is None:
+                # Намерение определено локально без GPT - получаем обычный ответ
                 response = await self.openai.get_response(context["messages"])
 
             # Отправляем ответ
@@ -207,6 +286,38 @@ class ConsultantBot:
                 "Извините, произошла ошибка при обработке вашего сообщения. Пожалуйста, попробуйте еще раз."
             )
 
+    async def _book_slot(self, user_id, context, selected_slot):
+        """
+        Создание встречи по выбранному слоту и отправка ссылки клиенту.
+
+        Args:
+            user_id (int): ID пользователя
+            context (dict): Контекст беседы
+            selected_slot (dict): Выбранный временной слот
+        """
+        # Создаем встречу в Google Calendar
+        meet_link = await self.calendar.create_meeting(
+            self.consultation_topic,
+            selected_slot["start"],
+            selected_slot["end"]
+        )
+
+        # Отправляем ссылку на встречу
+        response = f"Отлично! Я создал встречу на {selected_slot['start_str']}. "
+        response += f"Вот ссылка для подключения: {meet_link}"
+
+        await self.app.send_message(user_id, response)
+
+        # Сбрасываем флаг назначения встречи
+        context["meeting_scheduling"] = False
+        context["available_slots"] = []
+
+        # Добавляем ответ в контекст
+        context["messages"].append({
+            "role": "assistant",
+            "content": response
+        })
+
     def _check_if_slot_selected(self, message_text, available_slots):
         """
         Проверяет, выбрал ли клиент временной слот.
@@ -219,12 +330,13 @@ class ConsultantBot:
             dict: Выбранный слот или None
         """
         try:
-            # Проверяем, содержит ли сообщение номер слота
-            for digit in message_text.strip().split():
-                if digit.isdigit():
-                    slot_index = int(digit) - 1
-                    if 0 <= slot_index < len(available_slots):
-                        return available_slots[slot_index]
+            # Ищем номер слота скомпилированным регулярным выражением:
+            # находит и "3", и "давайте слот 3" без разбиения строки
+            match = _SLOT_RE.search(message_text)
+            if match:
+                slot_index = int(match.group(1)) - 1
+                if 0 <= slot_index < len(available_slots):
+                    return available_slots[slot_index]
 
             return None
         except Exception:
@@ -238,47 +350,66 @@ class ConsultantBot:
             try:
                 # Проверяем, является ли сообщение текстовым
                 if message.text:
-                    # Проверяем, что сообщение от нужного клиента
-                    contact = await self._get_contact_by_phone(self.phone_number)
-                    if contact and message.from_user.id == contact.id:
+                    # Сравниваем с кэшированным ID клиента - без запросов к API
+                    if self._target_user_id is not None and message.from_user.id == self._target_user_id:
                         self._log(f"Получено сообщение от клиента: {message.text[:30]}...")
-                        await self.process_message(message)
+                        await self._enqueue_message(message)
             except Exception as e:
                 self._log(f"Ошибка в обработчике сообщений: {e}")
 
     async def _start(self):
         """Запуск бота."""
         try:
+            # Событие остановки привязываем к работающему циклу событий
+            self._loop = asyncio.get_running_loop()
+            self._stop_event = asyncio.Event()
+
             # Запуск клиента Telegram
             await self.app.start()
 
             # Настройка обработчика сообщений
             await self._setup_message_handler()
 
+            # Прогреваем соединение с OpenAI до первого сообщения
+            await self.openai.warmup()
+
             # Отправка начального сообщения
             success = await self.send_initial_message()
             if not success:
                 self._log("Не удалось отправить начальное сообщение клиенту")
                 await self.app.stop()
+                await self.openai.aclose()
+                await self.calendar.aclose()
                 return
 
             self.is_running = True
             self._log("Бот успешно запущен")
 
-            # Ожидаем до остановки бота
-            while self.is_running:
-                await asyncio.sleep(1)
+            # Ожидаем сигнала остановки без периодических пробуждений
+            await self._stop_event.wait()
 
             # Останавливаем клиент
             await self.app.stop()
+            await self.openai.aclose()
+            await self.calendar.aclose()
 
         except Exception as e:
             self._log(f"Ошибка при запуске бота: {e}")
             if self.app.is_connected:
                 await self.app.stop()
+            await self.openai.aclose()
+            await self.calendar.aclose()
 
     def run(self):
         """Запуск бота в синхронном контексте."""
+        # uvloop заметно ускоряет сокетную нагрузку (Telegram, OpenAI,
+        # Calendar); при его отсутствии остается стандартный цикл событий
+        try:
+            import uvloop
+            uvloop.install()
+        except ImportError:
+            pass
+
         loop = asyncio.new_event_loop()
         asyncio.set_event_loop(loop)
         loop.run_until_complete(self._start())
@@ -286,4 +417,10 @@ class ConsultantBot:
     def stop(self):
         """Остановка бота."""
         self.is_running = False
+
+        # stop() вызывается из другого потока (контроллера), поэтому
+        # событие выставляется через call_soon_threadsafe
+        if self._stop_event is not None and self._loop is not None:
+            self._loop.call_soon_threadsafe(self._stop_event.set)
+
         self._log("Бот остановлен")
\ No newline at end of file
@@ -5,15 +5,33 @@ import logging
 import os
 import datetime
 import asyncio
-from google.oauth2.credentials import Credentials
+import aiofiles
+from aiogoogle import Aiogoogle
+from aiogoogle.auth.creds import ClientCreds, UserCreds
 from google_auth_oauthlib.flow import InstalledAppFlow
 from google.auth.transport.requests import Request
-from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
 import pickle
 
 logger = logging.getLogger(__name__)
 
+def _load_cached_token():
+    """Однократное чтение сохраненного токена при импорте модуля."""
+    if os.path.exists('token.pickle'):
+        try:
+            with open('token.pickle', 'rb') as token:
+                return pickle.load(token)
+        except Exception as e:
+            logger.warning(f"Не удалось прочитать token.pickle: {e}")
+    return None
+
+
+# Кэш учетных данных на уровне модуля: повторные запуски бота не читают
+# token.pickle и не проходят авторизацию заново. saved_token хранит
+# последний записанный на диск токен, чтобы не переписывать файл без
+# изменений. Сам клиент Aiogoogle здесь кэшировать нельзя: его сессия
+# aiohttp привязана к циклу событий, а каждый запуск бота создает новый
+_CRED_CACHE = {"creds": _load_cached_token(), "saved_token": None}
+
 
 class GoogleCalendarIntegration:
     """
@@ -27,7 +45,13 @@ class GoogleCalendarIntegration:
     def __init__(self):
         """Инициализация интеграции с Google Calendar."""
         self.credentials = None
-        self.service = None
+
+        # Асинхронный клиент Google API и объект Calendar API
+        self.aiogoogle = None
+        self.calendar = None
+
+        # Фоновая задача проактивного обновления токена
+        self._refresh_task = None
 
     async def _get_credentials(self):
         """
@@ -48,11 +72,16 @@ class GoogleCalendarIntegration:
         Returns:
             Credentials: Учетные данные Google API
         """
-        creds = None
-        # Проверяем, есть ли сохраненные токены
-        if os.path.exists('token.pickle'):
-            with open('token.pickle', 'rb') as token:
-                creds = pickle.load(token)
+        # Сначала проверяем кэш в памяти (заполняется при импорте модуля)
+        creds = _CRED_CACHE["creds"]
+        if creds and creds.valid:
+            # Обновляем токен заранее, если до истечения осталось меньше 5 минут
+            if creds.expiry and creds.refresh_token:
+                seconds_left = (creds.expiry - datetime.datetime.utcnow()).total_seconds()
+                if seconds_left < 300:
+                    creds.refresh(Request())
+                    self._persist_credentials_sync(creds)
+            return creds
 
         # Если нет действительных учетных данных, получаем новые
         if not creds or not creds.valid:
@@ -69,41 +98,156 @@ class GoogleCalendarIntegration:
                 creds = flow.run_local_server(port=0)
 
             # Сохраняем учетные данные для следующего запуска
-            with open('token.pickle', 'wb') as token:
-                pickle.dump(creds, token)
+            self._persist_credentials_sync(creds)
 
+        _CRED_CACHE["creds"] = creds
         return creds
 
+    def _persist_credentials_sync(self, creds):
+        """
+        Сохранение токена на диск, только если он изменился.
+
+        Args:
+            creds (Credentials): Учетные данные Google API
+        """
+        if creds.token == _CRED_CACHE["saved_token"]:
+            return
+
+        with open('token.pickle', 'wb') as token:
+            pickle.dump(creds, token)
+
+        _CRED_CACHE["saved_token"] = creds.token
+
+    async def _persist_credentials(self, creds):
+        """
+        Асинхронное сохранение токена без блокировки цикла событий.
+
+        Args:
+            creds (Credentials): Учетные данные Google API
+        """
+        if creds.token == _CRED_CACHE["saved_token"]:
+            return
+
+        data = pickle.dumps(creds)
+        async with aiofiles.open('token.pickle', 'wb') as token:
+            await token.write(data)
+
+        _CRED_CACHE["saved_token"] = creds.token
+
+    def _build_user_creds(self, creds):
+        """
+        Преобразование учетных данных google-auth в формат aiogoogle.
+
+        Args:
+            creds (Credentials): Учетные данные google-auth
+
+        Returns:
+            UserCreds: Учетные данные пользователя для aiogoogle
+        """
+        return UserCreds(
+            access_token=creds.token,
+            refresh_token=creds.refresh_token,
+            expires_at=creds.expiry.isoformat() if creds.expiry else None
+        )
+
     async def _initialize_service(self):
         """
-        Инициализация сервиса Google Calendar.
+        Инициализация асинхронного клиента Google Calendar.
 
         Returns:
-            bool: True, если сервис успешно инициализирован, иначе False
+            bool: True, если клиент успешно инициализирован, иначе False
         """
         try:
-            if self.service:
+            if self.calendar:
                 return True
 
-            # Получаем учетные данные
+            # Получаем учетные данные (токен берется из кэша модуля)
             self.credentials = await self._get_credentials()
             if not self.credentials:
                 logger.error("Не удалось получить учетные данные Google")
                 return False
 
-            # Инициализируем сервис
-            loop = asyncio.get_event_loop()
-            self.service = await loop.run_in_executor(
-                None,
-                lambda: build('calendar', 'v3', credentials=self.credentials)
+            # Создаем асинхронный клиент: запросы к Calendar идут прямо
+            # в цикле событий, без переключений на пул потоков. Клиент
+            # и discovery создаются на каждый экземпляр бота - на текущем
+            # цикле событий, а не на цикле первого запуска
+            self.aiogoogle = Aiogoogle(
+                user_creds=self._build_user_creds(self.credentials),
+                client_creds=ClientCreds(
+                    client_id=self.credentials.client_id,
+                    client_secret=self.credentials.client_secret,
+                    scopes=self.SCOPES
+                )
             )
+            self.calendar = await self.aiogoogle.discover('calendar', 'v3')
+
+            # Запускаем фоновое обновление токена до его истечения
+            if self._refresh_task is None:
+                self._refresh_task = asyncio.create_task(self._refresh_credentials_loop())
 
             return True
 
         except Exception as e:
-            logger.error(f"Ошибка при инициализации сервиса Calendar: {e}")
+            logger.error(f"Ошибка при инициализации клиента Calendar: {e}")
             return False
 
+    async def aclose(self):
+        """Закрытие сессии клиента Calendar при остановке бота."""
+        # Останавливаем фоновое обновление токена: иначе задача
+        # остается висеть на умирающем цикле событий
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+            try:
+                await self._refresh_task
+            except asyncio.CancelledError:
+                pass
+            self._refresh_task = None
+
+        try:
+            if self.aiogoogle is not None and self.aiogoogle.active_session is not None:
+                await self.aiogoogle.active_session.close()
+        except Exception as e:
+            logger.error(f"Ошибка при закрытии сессии Calendar: {e}")
+
+        self.aiogoogle = None
+        self.calendar = None
+
+    async def _refresh_credentials_loop(self):
+        """
+        Фоновое обновление токена за 5 минут до его истечения.
+
+        Держит учетные данные в кэше всегда действительными, чтобы
+        горячий путь создания встреч не ждал обновления токена.
+        """
+        while True:
+            try:
+                creds = _CRED_CACHE["creds"]
+                if not creds or not creds.expiry or not creds.refresh_token:
+                    await asyncio.sleep(300)
+                    continue
+
+                delay = (creds.expiry - datetime.datetime.utcnow()).total_seconds() - 300
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+                loop = asyncio.get_event_loop()
+                await loop.run_in_executor(None, lambda: creds.refresh(Request()))
+
+                # Передаем обновленный токен в клиент aiogoogle
+                if self.aiogoogle:
+                    self.aiogoogle.user_creds = self._build_user_creds(creds)
+
+                # Сохраняем обновленный токен, не блокируя цикл событий
+                await self._persist_credentials(creds)
+
+                logger.info("Токен Google Calendar обновлен в фоновом режиме")
+
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"Ошибка при фоновом обновлении токена: {e}")
+                await asyncio.sleep(300)
+
     async def get_available_slots(self, days=3, duration_minutes=30):
         """
         Получение доступных временных слотов для встречи.
@@ -116,10 +260,10 @@ class GoogleCalendarIntegration:
             list: Список доступных временных слотов
         """
         try:
-            # Инициализируем сервис
+            # Инициализируем клиент
             service_initialized = await self._initialize_service()
             if not service_initialized:
-                logger.error("Не удалось инициализировать сервис Calendar")
+                logger.error("Не удалось инициализировать клиент Calendar")
                 return []
 
             # Получаем текущее время и время окончания периода
@@ -130,117 +274,84 @@ class GoogleCalendarIntegration:
             time_min = now.isoformat() + 'Z'
             time_max = end_time.isoformat() + 'Z'
 
-            # Получаем список событий в календаре для указанного периода
-            loop = asyncio.get_event_loop()
-            events_result = await loop.run_in_executor(
-                None,
-                lambda: self.service.events().list(
-                    calendarId='primary',
-                    timeMin=time_min,
-                    timeMax=time_max,
-                    singleEvents=True,
-                    orderBy='startTime'
-                ).execute()
+            # Запрашиваем занятые интервалы одним запросом freebusy:
+            # сервер возвращает сразу список {start, end} вместо всех событий
+            freebusy_result = await self.aiogoogle.as_user(
+                self.calendar.freebusy.query(
+                    json={
+                        "timeMin": time_min,
+                        "timeMax": time_max,
+                        "items": [{"id": "primary"}]
+                    }
+                )
             )
 
-            events = events_result.get('items', [])
-
-            # Создаем список доступных слотов
-            # Учитываем рабочее время (с 9:00 до 18:00)
-            available_slots = []
-
-            current_date = now.replace(hour=0, minute=0, second=0, microsecond=0)
-            end_date = end_time.replace(hour=0, minute=0, second=0, microsecond=0)
-
-            # Словарь для хранения занятых временных интервалов
-            busy_times = {}
-
-            # Заполняем словарь занятых временных интервалов
-            for event in events:
-                start = event['start'].get('dateTime')
-                end = event['end'].get('dateTime')
-
-                if start and end:
-                    start_dt = datetime.datetime.fromisoformat(start.replace('Z', '+00:00'))
-                    end_dt = datetime.datetime.fromisoformat(end.replace('Z', '+00:00'))
-
-                    day_key = start_dt.date().isoformat()
+            busy_raw = freebusy_result.get("calendars", {}).get("primary", {}).get("busy", [])
 
-                    if day_key not in busy_times:
-                        busy_times[day_key] = []
-
-                    busy_times[day_key].append((start_dt, end_dt))
-
-            # Перебираем дни
-            while current_date <= end_date:
-                day_key = current_date.date().isoformat()
-
-                # Рабочее время для текущего дня
-                # Если текущий день - сегодня, начинаем с текущего времени
-                if current_date.date() == now.date():
-                    work_start = max(
-                        current_date.replace(hour=9, minute=0),
-                        now.replace(minute=(now.minute // 30) * 30)  # Округляем до ближайших 30 минут
-                    )
-                else:
-                    work_start = current_date.replace(hour=9, minute=0)
-
-                work_end = current_date.replace(hour=18, minute=0)
-
-                # Получаем занятые интервалы для текущего дня
-                day_busy_times = busy_times.get(day_key, [])
-
-                # Сортируем занятые интервалы по времени начала
-                day_busy_times.sort(key=lambda x: x[0])
-
-                # Текущее время начала свободного слота
-                slot_start = work_start
-
-                # Перебираем занятые интервалы
-                for busy_start, busy_end in day_busy_times:
-                    # Если есть свободное время до начала занятого интервала
-                    if slot_start + datetime.timedelta(minutes=duration_minutes) <= busy_start:
-                        # Добавляем свободные слоты с интервалом в 30 минут
-                        current_slot = slot_start
-                        while current_slot + datetime.timedelta(minutes=duration_minutes) <= busy_start:
-                            slot_end = current_slot + datetime.timedelta(minutes=duration_minutes)
-
-                            # Форматируем время для отображения
-                            start_str = current_slot.strftime("%d.%m.%Y %H:%M")
-
-                            available_slots.append({
-                                "start": current_slot,
-                                "end": slot_end,
-                                "start_str": start_str
-                            })
-
-                            current_slot += datetime.timedelta(minutes=30)
-
-                    # Обновляем время начала следующего свободного слота
-                    slot_start = max(slot_start, busy_end)
-
-                # Проверяем, осталось ли свободное время до конца рабочего дня
-                if slot_start + datetime.timedelta(minutes=duration_minutes) <= work_end:
-                    current_slot = slot_start
-                    while current_slot + datetime.timedelta(minutes=duration_minutes) <= work_end:
-                        slot_end = current_slot + datetime.timedelta(minutes=duration_minutes)
-
-                        # Форматируем время для отображения
-                        start_str = current_slot.strftime("%d.%m.%Y %H:%M")
-
-                        available_slots.append({
-                            "start": current_slot,
-                            "end": slot_end,
-                            "start_str": start_str
-                        })
+            # Единый отсортированный список занятых интервалов (наивный UTC)
+            busy_intervals = sorted(
+                (
+                    datetime.datetime.fromisoformat(interval["start"].replace('Z', '+00:00')).replace(tzinfo=None),
+                    datetime.datetime.fromisoformat(interval["end"].replace('Z', '+00:00')).replace(tzinfo=None)
+                )
+                for interval in busy_raw
+            )
 
-                        current_slot += datetime.timedelta(minutes=30)
+            # Представляем окно поиска целочисленной сеткой минут с шагом 30:
+            # проверка пересечений с занятыми интервалами идет в int-арифметике,
+            # а объекты datetime и строки создаются только для итоговых слотов
+            day_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+
+            def to_minutes(dt):
+                return int((dt - day_start).total_seconds()) // 60
+
+            # Занятые интервалы в минутах от начала сегодняшнего дня
+            # (конец интервала округляется вверх)
+            busy_minutes = [
+                (to_minutes(busy_start), -(-int((busy_end - day_start).total_seconds()) // 60))
+                for busy_start, busy_end in busy_intervals
+            ]
+
+            # Первый доступный момент сегодня: текущее время, округленное до 30 минут
+            now_minutes = (to_minutes(now) // 30) * 30
+
+            # Перебираем сетку слотов в рабочее время (с 9:00 до 18:00).
+            # Клиенту показывается не больше 10 слотов, поэтому перебор
+            # останавливается, как только они набраны
+            candidate_minutes = []
+            for day in range(days + 1):
+                work_start = day * 1440 + 9 * 60
+                work_end = day * 1440 + 18 * 60
+
+                if day == 0:
+                    work_start = max(work_start, now_minutes)
+
+                for slot_start in range(work_start, work_end - duration_minutes + 1, 30):
+                    slot_end = slot_start + duration_minutes
+                    if all(slot_end <= busy_start or slot_start >= busy_end
+                           for busy_start, busy_end in busy_minutes):
+                        candidate_minutes.append(slot_start)
+                        if len(candidate_minutes) >= 10:
+                            break
+
+                if len(candidate_minutes) >= 10:
+                    break
+
+            # Преобразуем в datetime и форматируем найденные слоты
+            available_slots = []
+            for slot_minutes in candidate_minutes:
+                slot_start_dt = day_start + datetime.timedelta(minutes=slot_minutes)
+                slot_end_dt = slot_start_dt + datetime.timedelta(minutes=duration_minutes)
 
-                # Переходим к следующему дню
-                current_date += datetime.timedelta(days=1)
+                available_slots.append({
+                    "start": slot_start_dt,
+                    "end": slot_end_dt,
+                    # f-строка заметно быстрее strftime: формат не разбирается заново
+                    "start_str": f"{slot_start_dt.day:02d}.{slot_start_dt.month:02d}.{slot_start_dt.year} "
+                                 f"{slot_start_dt.hour:02d}:{slot_start_dt.minute:02d}"
+                })
 
-            # Возвращаем найденные слоты (ограничиваем до 10 первых)
-            return available_slots[:10]
+            return available_slots
 
         except Exception as e:
             logger.error(f"Ошибка при получении доступных слотов: {e}")
@@ -259,10 +370,10 @@ class GoogleCalendarIntegration:
             str: Ссылка на встречу в Google Meet или None в случае ошибки
         """
         try:
-            # Инициализируем сервис
+            # Инициализируем клиент
             service_initialized = await self._initialize_service()
             if not service_initialized:
-                logger.error("Не удалось инициализировать сервис Calendar")
+                logger.error("Не удалось инициализировать клиент Calendar")
                 return None
 
             # Создаем событие в календаре с включенной видеоконференцией
@@ -285,14 +396,12 @@ class GoogleCalendarIntegration:
                 }
             }
 
-            loop = asyncio.get_event_loop()
-            event = await loop.run_in_executor(
-                None,
-                lambda: self.service.events().insert(
+            event = await self.aiogoogle.as_user(
+                self.calendar.events.insert(
                     calendarId='primary',
-                    body=event,
-                    conferenceDataVersion=1
-                ).execute()
+                    conferenceDataVersion=1,
+                    json=event
+                )
             )
 
             # Получаем ссылку на Google Meet
@@ -307,4 +416,4 @@ class GoogleCalendarIntegration:
 
         except Exception as e:
             logger.error(f"Ошибка при создании встречи: {e}")
-            return None
\ No newline at end of file
+            return None
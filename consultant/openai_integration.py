@@ -1,17 +1,64 @@
 # consultant/openai_integration.py
 # Интеграция с OpenAI (GPT) для генерации ответов
 
+import functools
+import json
 import logging
+import os
+import re
+import httpx
 import openai
+import tenacity
+from aiolimiter import AsyncLimiter
 
 logger = logging.getLogger(__name__)
 
+# Регулярные выражения для локального определения намерения назначить встречу.
+# Позволяют не обращаться к OpenAI для очевидных случаев.
+_INTENT_RE = re.compile(
+    r'\b(встреч|созвон|видеовстреч|видеоконсульт|видеозвон|meet|zoom|назнач|запис|время)\w*',
+    re.IGNORECASE
+)
+_NEGATIVE_RE = re.compile(
+    r'\b(не|нет|без|отказ\w*|потом|позже|передума\w*)\b',
+    re.IGNORECASE
+)
+
+
+@functools.lru_cache(maxsize=256)
+def _classify_intent_local(text):
+    """
+    Локальная классификация намерения по ключевым словам.
+
+    Args:
+        text (str): Нормализованный текст сообщения
+
+    Returns:
+        bool or None: True/False для однозначных случаев, None если нужен GPT
+    """
+    if not _INTENT_RE.search(text):
+        # Нет ни одного слова, связанного со встречей - намерения точно нет
+        return False
+
+    if _NEGATIVE_RE.search(text):
+        # Есть и упоминание встречи, и отрицание - случай неоднозначный
+        return None
+
+    # Явное упоминание встречи без отрицаний
+    return True
+
 
 class OpenAIIntegration:
     """
     Класс для интеграции с OpenAI API и работы с GPT для генерации ответов.
     """
 
+    # Модель семейства gpt-4o: автоматическое кэширование промпта означает,
+    # что стабильный префикс (системный промпт) не пересчитывается на каждом
+    # ходу - дешевле и быстрее до первого токена. Системные промпты собираются
+    # один раз в __init__ и не меняются, чтобы кэш срабатывал байт-в-байт.
+    MODEL = "gpt-4o-mini"
+
     def __init__(self, api_key, consultation_topic):
         """
         Инициализация интеграции с OpenAI.
@@ -22,7 +69,26 @@ class OpenAIIntegration:
         """
         self.api_key = api_key
         self.consultation_topic = consultation_topic
-        self.client = openai.AsyncOpenAI(api_key=api_key)
+
+        # Долгоживущий HTTP/2-клиент с keep-alive, чтобы не платить
+        # за TLS-рукопожатие на каждом обращении к API
+        self._http_client = httpx.AsyncClient(
+            http2=True,
+            limits=httpx.Limits(max_keepalive_connections=32, keepalive_expiry=600),
+            timeout=30
+        )
+        self.client = openai.AsyncOpenAI(api_key=api_key, http_client=self._http_client)
+
+        # Кэш результатов определения намерения (нормализованный текст -> bool)
+        self._intent_cache = {}
+
+        # Глобальные ведра частоты запросов и токенов: конкурентные диалоги
+        # не упираются в лимиты API. Подстраиваются под аккаунт через
+        # переменные окружения OPENAI_RPM / OPENAI_TPM
+        self._rpm = int(os.getenv("OPENAI_RPM", "500"))
+        self._tpm = int(os.getenv("OPENAI_TPM", "200000"))
+        self._rpm_bucket = AsyncLimiter(max_rate=self._rpm, time_period=60)
+        self._tpm_bucket = AsyncLimiter(max_rate=self._tpm, time_period=60)
 
         # Создаем системный промпт
         self.system_prompt = f"""Ты - профессиональный консультант по {consultation_topic}. 
@@ -33,6 +99,71 @@ class OpenAIIntegration:
         конкретные доступные варианты. Общайся естественно, как человек, избегай шаблонных фраз и 
         формулировок, типичных для ботов."""
 
+        # Системный промпт для объединенного запроса: классификация намерения
+        # и генерация ответа за одно обращение к API
+        self.combined_system_prompt = self.system_prompt + """
+
+        Отвечай строго в формате JSON с двумя полями:
+        "intent" - "meeting", если клиент хочет назначить встречу или видеоконсультацию, иначе "chat";
+        "reply" - твой ответ клиенту."""
+
+        # Готовые системные сообщения: один статичный dict вместо
+        # нового литерала на каждый запрос
+        self._system_msg = {"role": "system", "content": self.system_prompt}
+        self._combined_system_msg = {"role": "system", "content": self.combined_system_prompt}
+        self._intent_system_msg = {
+            "role": "system",
+            "content": "Ты - система определения намерений. Определи, хочет ли клиент назначить встречу или видеоконсультацию. Ответь только 'да' или 'нет'."
+        }
+
+    async def _chat_create(self, **kwargs):
+        """
+        Вызов chat.completions.create с ограничением частоты и повторами.
+
+        Запрос проходит через RPM- и TPM-ведра, а RateLimitError
+        обрабатывается экспоненциальными повторами с джиттером.
+
+        Args:
+            **kwargs: Параметры для chat.completions.create
+
+        Returns:
+            ChatCompletion: Ответ API
+        """
+        # Грубая оценка токенов запроса: ~4 символа на токен плюс лимит ответа
+        est_tokens = kwargs.get("max_tokens", 0) + sum(
+            len(m.get("content") or "") // 4 for m in kwargs.get("messages", [])
+        )
+
+        async for attempt in tenacity.AsyncRetrying(
+            retry=tenacity.retry_if_exception_type(openai.RateLimitError),
+            wait=tenacity.wait_exponential_jitter(initial=1, max=30),
+            stop=tenacity.stop_after_attempt(5),
+            reraise=True
+        ):
+            with attempt:
+                async with self._rpm_bucket:
+                    await self._tpm_bucket.acquire(min(est_tokens, self._tpm))
+                    return await self.client.chat.completions.create(**kwargs)
+
+    async def warmup(self):
+        """
+        Прогрев HTTP-соединения с API OpenAI.
+
+        Дешевый запрос устанавливает TLS и HTTP/2-сессию заранее,
+        чтобы первое сообщение клиента не ждало рукопожатия.
+        """
+        try:
+            await self.client.models.list()
+        except Exception as e:
+            logger.warning(f"Не удалось прогреть соединение с OpenAI: {e}")
+
+    async def aclose(self):
+        """Закрытие HTTP-клиента при остановке бота."""
+        try:
+            await self._http_client.aclose()
+        except Exception as e:
+            logger.warning(f"Ошибка при закрытии HTTP-клиента: {e}")
+
     async def get_initial_message(self):
         """
         Генерация начального сообщения для клиента.
@@ -47,8 +178,8 @@ class OpenAIIntegration:
                  "content": f"Напиши привлекательное первое сообщение для потенциального клиента, который интересуется {self.consultation_topic}. Не предлагай встречу, просто заинтересуй его."}
             ]
 
-            response = await self.client.chat.completions.create(
-                model="gpt-3.5-turbo",
+            response = await self._chat_create(
+                model=self.MODEL,
                 messages=messages,
                 max_tokens=300,
                 temperature=0.7
@@ -72,11 +203,10 @@ class OpenAIIntegration:
         """
         try:
             # Формируем запрос для GPT
-            formatted_messages = [{"role": "system", "content": self.system_prompt}]
-            formatted_messages.extend(messages)
+            formatted_messages = [self._system_msg, *messages]
 
-            response = await self.client.chat.completions.create(
-                model="gpt-3.5-turbo",
+            response = await self._chat_create(
+                model=self.MODEL,
                 messages=formatted_messages,
                 max_tokens=500,
                 temperature=0.7
@@ -88,6 +218,52 @@ class OpenAIIntegration:
             logger.error(f"Ошибка при получении ответа от GPT: {e}")
             return "Извините, произошла ошибка при обработке вашего запроса. Пожалуйста, попробуйте еще раз."
 
+    async def get_response_with_intent(self, messages):
+        """
+        Определение намерения и генерация ответа за один запрос к GPT.
+
+        Вместо двух последовательных обращений (detect_meeting_intent +
+        get_response) выполняется один запрос со структурированным ответом.
+
+        Args:
+            messages (list): История сообщений
+
+        Returns:
+            tuple: (bool, str) - намерение назначить встречу и ответ клиенту.
+                Ответ равен None, если намерение определено локально и
+                обращение к GPT не потребовалось.
+        """
+        # Пробуем классифицировать последнее сообщение локально
+        last_text = messages[-1]["content"] if messages else ""
+        local_result = _classify_intent_local(" ".join(last_text.lower().split()))
+
+        if local_result is True:
+            # Намерение очевидно - ответ сформирует сценарий назначения встречи
+            return True, None
+
+        if local_result is False:
+            # Намерения точно нет - достаточно обычного ответа
+            return False, await self.get_response(messages)
+
+        # Неоднозначный случай: один запрос с классификацией и ответом
+        try:
+            formatted_messages = [self._combined_system_msg, *messages]
+
+            response = await self._chat_create(
+                model=self.MODEL,
+                messages=formatted_messages,
+                max_tokens=500,
+                temperature=0.7,
+                response_format={"type": "json_object"}
+            )
+
+            data = json.loads(response.choices[0].message.content)
+            return data.get("intent") == "meeting", data.get("reply")
+
+        except Exception as e:
+            logger.error(f"Ошибка при получении структурированного ответа от GPT: {e}")
+            return False, "Извините, произошла ошибка при обработке вашего запроса. Пожалуйста, попробуйте еще раз."
+
     async def detect_meeting_intent(self, message):
         """
         Определение намерения клиента назначить встречу.
@@ -98,23 +274,40 @@ class OpenAIIntegration:
         Returns:
             bool: True, если клиент хочет назначить встречу, иначе False
         """
+        # Сначала пробуем определить намерение локально, без обращения к OpenAI
+        normalized = " ".join(message.lower().split())
+
+        local_result = _classify_intent_local(normalized)
+        if local_result is not None:
+            return local_result
+
+        # Проверяем кэш результатов GPT для повторяющихся сообщений
+        if normalized in self._intent_cache:
+            return self._intent_cache[normalized]
+
         try:
             # Формируем запрос для определения намерения
             messages = [
-                {"role": "system",
-                 "content": "Ты - система определения намерений. Определи, хочет ли клиент назначить встречу или видеоконсультацию. Ответь только 'да' или 'нет'."},
+                self._intent_system_msg,
                 {"role": "user", "content": message}
             ]
 
-            response = await self.client.chat.completions.create(
-                model="gpt-3.5-turbo",
+            response = await self._chat_create(
+                model=self.MODEL,
                 messages=messages,
                 max_tokens=10,
                 temperature=0.1
             )
 
             intent_response = response.choices[0].message.content.strip().lower()
-            return "да" in intent_response
+            result = "да" in intent_response
+
+            # Кэшируем результат, ограничивая размер кэша
+            if len(self._intent_cache) >= 256:
+                self._intent_cache.clear()
+            self._intent_cache[normalized] = result
+
+            return result
 
         except Exception as e:
             logger.error(f"Ошибка при определении намерения: {e}")
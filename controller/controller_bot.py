@@ -1,14 +1,27 @@
 # controller/controller_bot.py
 # Реализация управляющего бота (контроллера)
 
+import collections
+import concurrent.futures
 import logging
-import os
+import queue
+import re
+import threading
 import tkinter as tk
 from tkinter import ttk, scrolledtext
-from consultant.consultant_bot import ConsultantBot
 
 logger = logging.getLogger(__name__)
 
+# Поле считается заполненным, если в нем есть хотя бы один непробельный символ
+_NON_EMPTY = re.compile(r"\S")
+
+# Клавиши, которые не меняют текст лог-области: навигация по буферу,
+# выделение и сами модификаторы
+_LOG_NAV_KEYS = frozenset((
+    "Up", "Down", "Left", "Right", "Prior", "Next", "Home", "End",
+    "Shift_L", "Shift_R", "Control_L", "Control_R", "Alt_L", "Alt_R",
+))
+
 
 class ControllerBot:
     """
@@ -16,51 +29,115 @@ class ControllerBot:
     ботом-консультантом и мониторинга его работы.
     """
 
-    def __init__(self):
-        """Инициализация управляющего бота и его интерфейса."""
+    # Максимальное число строк в лог-области: старые строки вытесняются,
+    # чтобы память и время перерисовки виджета оставались ограниченными
+    MAX_LOG_LINES = 5000
+
+    def __init__(self, env=None):
+        """
+        Инициализация управляющего бота и его интерфейса.
+
+        Args:
+            env (dict): Конфигурация из .env для предзаполнения полей
+        """
+        self.env = env or {}
+
         self.root = tk.Tk()
         self.root.title("Telegram Consultant Bot Controller")
         self.root.geometry("800x600")
 
         self.consultant_bot = None
-        self.running = False
+
+        # Флаг работы бота: threading.Event вместо голого bool, так как
+        # его читают и основной поток Tk, и рабочий поток бота
+        self._running = threading.Event()
+
+        # Один переиспользуемый рабочий поток для цикла asyncio бота:
+        # перезапуски не плодят новые объекты Thread
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="consultant"
+        )
+        self._bot_future = None
+
+        # Флаг, что остановка уже идет: защищает от второго опроса future,
+        # если _stop_bot вызван и кнопкой, и из потока бота при ошибке
+        self._stopping = False
+
+        # Очередь логов: поток бота только кладет строки, виджет
+        # обновляет исключительно основной поток Tk в _drain_logs.
+        # Очередь регулярно переливается в ограниченный буфер, поэтому
+        # память не растет, даже пока вкладка логов не открыта
+        self._log_q = queue.SimpleQueue()
+        self._log_buffer = collections.deque(maxlen=self.MAX_LOG_LINES)
+
+        # Привязываем методы горячего пути логирования один раз:
+        # без LOAD_GLOBAL и поиска атрибута на каждое сообщение
+        self._log_q_put = self._log_q.put_nowait
+        self._logger_info = logger.info
 
         self._create_interface()
 
+        # Периодический перенос накопленных логов в интерфейс
+        self.root.after(100, self._drain_logs)
+
+        # Корректное завершение пула потоков при закрытии окна
+        self.root.protocol("WM_DELETE_WINDOW", self._on_close)
+
         logger.info("Контроллер инициализирован")
 
     def _create_interface(self):
         """Создание графического интерфейса."""
+        # Вкладки "Конфигурация" и "Логи": тяжелый виджет лог-области
+        # создается лениво, при первом открытии вкладки логов,
+        # и не замедляет появление окна
+        self.notebook = ttk.Notebook(self.root)
+        self.notebook.pack(fill="both", expand=True, padx=10, pady=10)
+
+        config_tab = ttk.Frame(self.notebook)
+        self.logs_tab = ttk.Frame(self.notebook)
+        self.notebook.add(config_tab, text="Конфигурация")
+        self.notebook.add(self.logs_tab, text="Логи")
+        self.notebook.bind("<<NotebookTabChanged>>", self._on_tab_changed)
+
         # Фрейм для ввода конфигурации
-        config_frame = ttk.LabelFrame(self.root, text="Конфигурация")
+        config_frame = ttk.LabelFrame(config_tab, text="Конфигурация")
         config_frame.pack(fill="x", padx=10, pady=10)
 
+        # Переменные Tk для полей ввода: чтение через StringVar.get()
+        # идет напрямую на уровне C, минуя обертку виджета, и позволяет
+        # при необходимости навесить trace_add для валидации без опроса
+        self.phone_var = tk.StringVar()
+        self.api_id_var = tk.StringVar()
+        self.api_hash_var = tk.StringVar()
+        self.openai_key_var = tk.StringVar()
+        self.topic_var = tk.StringVar()
+
         # Поле для ввода номера телефона клиента
         ttk.Label(config_frame, text="Номер телефона клиента:").grid(row=0, column=0, padx=5, pady=5, sticky="w")
-        self.phone_entry = ttk.Entry(config_frame, width=30)
+        self.phone_entry = ttk.Entry(config_frame, width=30, textvariable=self.phone_var)
         self.phone_entry.grid(row=0, column=1, padx=5, pady=5)
 
         # Поле для ввода API-ключа Telegram
         ttk.Label(config_frame, text="API ID Telegram:").grid(row=1, column=0, padx=5, pady=5, sticky="w")
-        self.api_id_entry = ttk.Entry(config_frame, width=30)
+        self.api_id_entry = ttk.Entry(config_frame, width=30, textvariable=self.api_id_var)
         self.api_id_entry.grid(row=1, column=1, padx=5, pady=5)
 
         ttk.Label(config_frame, text="API Hash Telegram:").grid(row=2, column=0, padx=5, pady=5, sticky="w")
-        self.api_hash_entry = ttk.Entry(config_frame, width=30)
+        self.api_hash_entry = ttk.Entry(config_frame, width=30, textvariable=self.api_hash_var)
         self.api_hash_entry.grid(row=2, column=1, padx=5, pady=5)
 
         # Поле для ввода API-ключа OpenAI
         ttk.Label(config_frame, text="API-ключ OpenAI:").grid(row=3, column=0, padx=5, pady=5, sticky="w")
-        self.openai_key_entry = ttk.Entry(config_frame, width=30)
+        self.openai_key_entry = ttk.Entry(config_frame, width=30, textvariable=self.openai_key_var)
         self.openai_key_entry.grid(row=3, column=1, padx=5, pady=5)
 
         # Поле для ввода темы консультации
         ttk.Label(config_frame, text="Тема консультации:").grid(row=4, column=0, padx=5, pady=5, sticky="w")
-        self.topic_entry = ttk.Entry(config_frame, width=30)
+        self.topic_entry = ttk.Entry(config_frame, width=30, textvariable=self.topic_var)
         self.topic_entry.grid(row=4, column=1, padx=5, pady=5)
 
         # Фрейм для кнопок управления
-        control_frame = ttk.Frame(self.root)
+        control_frame = ttk.Frame(config_tab)
         control_frame.pack(fill="x", padx=10, pady=5)
 
         # Кнопки для управления ботом
@@ -70,49 +147,132 @@ class ControllerBot:
         self.stop_button = ttk.Button(control_frame, text="Остановить бота", command=self._stop_bot, state="disabled")
         self.stop_button.pack(side="left", padx=5)
 
-        # Фрейм для вывода логов
-        log_frame = ttk.LabelFrame(self.root, text="Логи")
-        log_frame.pack(fill="both", expand=True, padx=10, pady=10)
-
-        self.log_area = scrolledtext.ScrolledText(log_frame, state="disabled", height=15)
-        self.log_area.pack(fill="both", expand=True, padx=5, pady=5)
+        # Лог-область создается в _on_tab_changed при первом открытии вкладки
+        self.log_area = None
 
         # Статус бота
         self.status_label = ttk.Label(self.root, text="Статус: Бот остановлен", foreground="red")
         self.status_label.pack(pady=10)
 
+        # Предзаполняем поля значениями из .env
+        self.phone_var.set(self.env.get("PHONE") or "")
+        self.api_id_var.set(self.env.get("TELEGRAM_API_ID") or "")
+        self.api_hash_var.set(self.env.get("TELEGRAM_API_HASH") or "")
+        self.openai_key_var.set(self.env.get("OPENAI_API_KEY") or "")
+        self.topic_var.set(self.env.get("CONSULTATION_TOPIC") or "")
+
+    def _on_tab_changed(self, event):
+        """Ленивая инициализация лог-области при первом открытии вкладки."""
+        if self.log_area is not None:
+            return
+
+        if self.notebook.select() != str(self.logs_tab):
+            return
+
+        self.log_area = scrolledtext.ScrolledText(self.logs_tab, height=15)
+        self.log_area.pack(fill="both", expand=True, padx=5, pady=5)
+
+        # Виджет остается в состоянии "normal", а ввод блокируется
+        # привязками: вставка логов обходится без двух configure(state=...)
+        # на каждое обновление. Копирование и навигация при этом работают
+        self.log_area.bind("<Key>", self._block_log_input)
+        self.log_area.bind("<<Paste>>", lambda e: "break")
+        # Вставка средней кнопкой мыши (PRIMARY-выделение в X11)
+        # идет отдельным виртуальным событием - блокируем и его
+        self.log_area.bind("<<PasteSelection>>", lambda e: "break")
+
+    def _block_log_input(self, event):
+        """Блокировка ввода в лог-области, кроме копирования и навигации."""
+        # Ctrl+C (копирование) и Ctrl+A (выделение всего) пропускаем
+        if event.state & 0x4 and event.keysym.lower() in ("c", "a"):
+            return None
+        if event.keysym in _LOG_NAV_KEYS:
+            return None
+        return "break"
+
     def _log_message(self, message):
-        """Добавление сообщения в лог-область интерфейса."""
-        self.log_area.configure(state="normal")
-        self.log_area.insert(tk.END, f"{message}\n")
-        self.log_area.see(tk.END)
-        self.log_area.configure(state="disabled")
-        logger.info(message)
+        """Добавление сообщения в очередь логов интерфейса."""
+        # Безопасно вызывается из любого потока: мутация виджета
+        # происходит только в основном потоке Tk. Перевод строки
+        # добавляется один раз здесь, чтобы при выводе склеивать
+        # пакет одним join без промежуточных строк
+        self._log_q_put(message + "\n")
+        self._logger_info("%s", message)
+
+    def _drain_logs(self):
+        """Перенос накопленных сообщений в лог-область одной вставкой."""
+        # Очередь переливается в буфер каждый тик, даже пока вкладка
+        # логов не открывалась: deque с maxlen вытесняет старые строки,
+        # и долгая сессия без открытия вкладки не копит память.
+        # При первом открытии вкладки буфер просто выводится в виджет
+        try:
+            while True:
+                self._log_buffer.append(self._log_q.get_nowait())
+        except queue.Empty:
+            pass
+
+        if self.log_area is None:
+            self.root.after(100, self._drain_logs)
+            return
+
+        batch = []
+        # Забираем до 200 сообщений за один тик
+        while self._log_buffer and len(batch) < 200:
+            batch.append(self._log_buffer.popleft())
+
+        if batch:
+            self.log_area.insert(tk.END, "".join(batch))
+
+            # Усечение буфера по принципу кольца: старые строки
+            # удаляются одним вызовом delete
+            lines = int(self.log_area.index('end-1c').split('.')[0])
+            if lines > self.MAX_LOG_LINES:
+                overflow = lines - self.MAX_LOG_LINES
+                self.log_area.delete("1.0", f"{overflow + 1}.0")
+                self.log_area.insert("1.0", f"... буфер логов усечен, удалено строк: {overflow}\n")
+
+            self.log_area.see(tk.END)
+
+            # Одна перерисовка на весь пакет, а не на каждую вставку
+            self.log_area.update_idletasks()
+
+        # Адаптивный интервал: при наплыве сообщений дренируем без паузы,
+        # в тишине просыпаемся реже
+        delay = 0 if len(self._log_buffer) > 64 else 100
+        self.root.after(delay, self._drain_logs)
 
     def _start_bot(self):
         """Запуск бота-консультанта с указанными параметрами."""
-        if self.running:
+        if self._running.is_set():
             self._log_message("Бот уже запущен")
             return
 
         # Получение введенных параметров
-        phone = self.phone_entry.get().strip()
-        api_id = self.api_id_entry.get().strip()
-        api_hash = self.api_hash_entry.get().strip()
-        openai_key = self.openai_key_entry.get().strip()
-        topic = self.topic_entry.get().strip()
-
-        # Проверка заполнения полей
-        if not all([phone, api_id, api_hash, openai_key, topic]):
-            self._log_message("Ошибка: Все поля должны быть заполнены")
-            return
-
-        # Установка переменных окружения для бота
-        os.environ['TELEGRAM_API_ID'] = api_id
-        os.environ['TELEGRAM_API_HASH'] = api_hash
-        os.environ['OPENAI_API_KEY'] = openai_key
+        phone = self.phone_var.get().strip()
+        api_id = self.api_id_var.get().strip()
+        api_hash = self.api_hash_var.get().strip()
+        openai_key = self.openai_key_var.get().strip()
+        topic = self.topic_var.get().strip()
+
+        # Проверка заполнения полей: сообщаем, какое именно поле пустое
+        fields = (
+            ("Номер телефона клиента", phone),
+            ("API ID Telegram", api_id),
+            ("API Hash Telegram", api_hash),
+            ("API-ключ OpenAI", openai_key),
+            ("Тема консультации", topic),
+        )
+        for field_name, value in fields:
+            if not _NON_EMPTY.search(value):
+                self._log_message(f"Ошибка: не заполнено поле \"{field_name}\"")
+                return
 
         try:
+            # Ленивый импорт: pyrogram/openai - тяжелые транзитивные
+            # зависимости, и окно контроллера появляется быстрее, если
+            # они загружаются только при первом запуске бота
+            from consultant.consultant_bot import ConsultantBot
+
             # Инициализация и запуск бота-консультанта
             self.consultant_bot = ConsultantBot(
                 phone_number=phone,
@@ -122,13 +282,13 @@ class ControllerBot:
                 consultation_topic=topic
             )
 
-            # Запуск бота в отдельном потоке
-            import threading
-            bot_thread = threading.Thread(target=self._run_bot_thread)
-            bot_thread.daemon = True
-            bot_thread.start()
+            # Запуск бота в рабочем потоке пула: mainloop Tk остается
+            # в основном потоке, цикл asyncio бота живет в рабочем. Команды
+            # из Tk-потока (stop) попадают в цикл через потокобезопасные
+            # методы бота (call_soon_threadsafe)
+            self._bot_future = self._executor.submit(self._run_bot_thread)
 
-            self.running = True
+            self._running.set()
             self.start_button.configure(state="disabled")
             self.stop_button.configure(state="normal")
             self.status_label.configure(text="Статус: Бот запущен", foreground="green")
@@ -147,27 +307,59 @@ class ControllerBot:
             self.consultant_bot.run()
         except Exception as e:
             self._log_message(f"Ошибка в работе бота: {e}")
-            self._stop_bot()
+            # _stop_bot трогает виджеты, поэтому выполняем его
+            # в основном потоке Tk, а не в потоке бота
+            self.root.after(0, self._stop_bot)
 
     def _stop_bot(self):
         """Остановка бота-консультанта."""
-        if not self.running:
+        if not self._running.is_set() or self._stopping:
             return
 
         try:
+            self._stopping = True
+
             if self.consultant_bot:
                 self.consultant_bot.stop()
 
-            self.running = False
-            self.start_button.configure(state="normal")
             self.stop_button.configure(state="disabled")
-            self.status_label.configure(text="Статус: Бот остановлен", foreground="red")
+            self.status_label.configure(text="Статус: Бот останавливается...", foreground="orange")
 
-            self._log_message("Бот остановлен")
+            # Завершения рабочего потока дожидаемся опросом через after():
+            # блокирующий result() замораживал бы mainloop (и вывод логов)
+            # на все время остановки цикла бота
+            self.root.after(100, self._poll_bot_stopped, 0)
 
         except Exception as e:
+            self._stopping = False
             self._log_message(f"Ошибка при остановке бота: {e}")
 
+    def _poll_bot_stopped(self, waited_ms):
+        """Опрос завершения рабочего потока без блокировки потока Tk."""
+        if self._bot_future is not None and not self._bot_future.done():
+            # Предупреждаем один раз, но продолжаем ждать: кнопка запуска
+            # включится только когда прежний цикл действительно завершится
+            if waited_ms == 5000:
+                self._log_message("Поток бота не завершился за 5 секунд, ожидание продолжается")
+            self.root.after(100, self._poll_bot_stopped, waited_ms + 100)
+            return
+
+        self._bot_future = None
+        self._stopping = False
+
+        self._running.clear()
+        self.start_button.configure(state="normal")
+        self.stop_button.configure(state="disabled")
+        self.status_label.configure(text="Статус: Бот остановлен", foreground="red")
+
+        self._log_message("Бот остановлен")
+
+    def _on_close(self):
+        """Завершение приложения: остановка бота и пула потоков."""
+        self._stop_bot()
+        self._executor.shutdown(wait=False)
+        self.root.destroy()
+
     def run(self):
         """Запуск основного цикла интерфейса."""
         self.root.mainloop()
\ No newline at end of file
@@ -0,0 +1,139 @@
+# log_handlers.py
+# Обработчики логирования с пакетной записью на диск
+
+import logging
+import os
+import platform
+import queue
+import threading
+
+# liburing - необязательная зависимость: без нее (или вне Linux)
+# используется обычный FileHandler
+try:
+    import liburing
+except ImportError:
+    liburing = None
+
+logger = logging.getLogger(__name__)
+
+
+class UringFileHandler(logging.Handler):
+    """
+    Обработчик логов с пакетной записью в файл через io_uring.
+
+    emit() только ставит отформатированную запись в очередь. Фоновый
+    поток собирает до max_batch записей, готовит по одному SQE на каждую
+    и отправляет весь пакет в ядро одним io_uring_submit - O(пакетов)
+    системных вызовов вместо O(записей).
+    """
+
+    def __init__(self, filename, max_batch=64, queue_depth=256, delay=False, encoding=None):
+        """
+        Инициализация обработчика.
+
+        Args:
+            filename (str): Путь к файлу логов
+            max_batch (int): Максимальное число записей в одном пакете
+            queue_depth (int): Глубина очереди io_uring
+            delay (bool): Открывать файл лениво, при первой записи
+            encoding (str): Кодировка записей (по умолчанию utf-8)
+        """
+        super().__init__()
+        self.filename = filename
+        self.max_batch = max_batch
+        self.encoding = encoding or "utf-8"
+
+        self._fd = None
+        if not delay:
+            self._open_fd()
+
+        self._ring = liburing.io_uring()
+        liburing.io_uring_queue_init(queue_depth, self._ring, 0)
+
+        self._queue = queue.SimpleQueue()
+        self._drain_thread = threading.Thread(
+            target=self._drain, name="uring-log", daemon=True
+        )
+        self._drain_thread.start()
+
+    def _open_fd(self):
+        """Открытие файла логов (лениво при delay=True)."""
+        if self._fd is None:
+            self._fd = os.open(self.filename, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+
+    def emit(self, record):
+        """Постановка отформатированной записи в очередь на запись."""
+        try:
+            self._queue.put_nowait((self.format(record) + "\n").encode(self.encoding))
+        except Exception:
+            self.handleError(record)
+
+    def _drain(self):
+        """Фоновый цикл: сбор пакета записей и отправка одним submit."""
+        cqe = liburing.io_uring_cqe()
+
+        while True:
+            # Блокируемся на первой записи, затем добираем пакет
+            item = self._queue.get()
+            if item is None:
+                break
+
+            batch = [item]
+            try:
+                while len(batch) < self.max_batch:
+                    item = self._queue.get_nowait()
+                    if item is None:
+                        return
+                    batch.append(item)
+            except queue.Empty:
+                pass
+
+            self._open_fd()
+
+            # Один SQE на запись, один submit на весь пакет
+            for data in batch:
+                sqe = liburing.io_uring_get_sqe(self._ring)
+                liburing.io_uring_prep_write(sqe, self._fd, data, len(data), -1)
+
+            liburing.io_uring_submit(self._ring)
+
+            # Дожидаемся завершения всех операций пакета
+            for _ in batch:
+                liburing.io_uring_wait_cqe(self._ring, cqe)
+                liburing.io_uring_cqe_seen(self._ring, cqe)
+
+    def close(self):
+        """Остановка фонового потока и освобождение ресурсов."""
+        try:
+            self._queue.put_nowait(None)
+            self._drain_thread.join(timeout=2)
+            liburing.io_uring_queue_exit(self._ring)
+            if self._fd is not None:
+                os.close(self._fd)
+        except Exception:
+            pass
+        super().close()
+
+
+def make_file_handler(filename, delay=False, encoding=None):
+    """
+    Создание файлового обработчика логов.
+
+    На Linux с установленным liburing возвращается обработчик с пакетной
+    записью через io_uring, иначе - стандартный FileHandler.
+
+    Args:
+        filename (str): Путь к файлу логов
+        delay (bool): Открывать файл лениво, при первой записи
+        encoding (str): Кодировка файла логов
+
+    Returns:
+        logging.Handler: Файловый обработчик
+    """
+    if liburing is not None and platform.system() == "Linux":
+        try:
+            return UringFileHandler(filename, delay=delay, encoding=encoding)
+        except Exception as e:
+            logger.warning(f"Не удалось инициализировать io_uring, используется FileHandler: {e}")
+
+    return logging.FileHandler(filename, delay=delay, encoding=encoding)
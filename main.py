@@ -3,34 +3,95 @@
 
 import logging
 import os
-from dotenv import load_dotenv
+import queue
+from logging.handlers import QueueHandler, QueueListener
+from dotenv import dotenv_values
 from controller.controller_bot import ControllerBot
+from log_handlers import make_file_handler
 
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("app.log"),
-        logging.StreamHandler()
-    ]
-)
+# Настройка логирования: записи попадают в очередь, а файл и консоль
+# обслуживает отдельный поток QueueListener - поток бота никогда
+# не блокируется на записи на диск.
+# Один Formatter на оба обработчика, а файл открывается лениво,
+# при первой записи (delay=True) - запуск окна не трогает диск
+_log_fmt = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+_file_handler = make_file_handler("app.log", delay=True, encoding="utf-8")
+_file_handler.setFormatter(_log_fmt)
+
+_stream_handler = logging.StreamHandler()
+_stream_handler.setFormatter(_log_fmt)
+
+_log_q = queue.Queue(-1)
+logging.basicConfig(level=logging.INFO, handlers=[QueueHandler(_log_q)])
+_log_listener = QueueListener(_log_q, _file_handler, _stream_handler)
 logger = logging.getLogger(__name__)
 
-# Загрузка переменных окружения из файла .env
-load_dotenv()
+
+def _install_orjson():
+    """
+    Подмена кодека stdlib json на orjson для всего процесса.
+
+    Клиенты Telegram, OpenAI и Google гоняют JSON на каждом запросе через
+    модуль json; orjson делает (де)сериализацию в 2-3 раза быстрее.
+    Вызовы с параметрами или входными данными, которых orjson не
+    поддерживает (нестроковые ключи словарей, NaN/Infinity и т.п.),
+    прозрачно уходят в стандартную реализацию, а без orjson ничего
+    не меняется.
+    """
+    try:
+        import json
+        import orjson
+    except ImportError:
+        return
+
+    _std_dumps = json.dumps
+    _std_loads = json.loads
+
+    def dumps(obj, **kwargs):
+        if kwargs:
+            return _std_dumps(obj, **kwargs)
+        try:
+            return orjson.dumps(obj).decode()
+        except TypeError:
+            # orjson строже stdlib: например, не принимает
+            # нестроковые ключи словарей
+            return _std_dumps(obj)
+
+    def loads(s, **kwargs):
+        if kwargs:
+            return _std_loads(s, **kwargs)
+        try:
+            return orjson.loads(s)
+        except orjson.JSONDecodeError:
+            # stdlib принимает NaN/Infinity, orjson - нет
+            return _std_loads(s)
+
+    json.dumps = dumps
+    json.loads = loads
+
+
+_install_orjson()
+
+# Чтение конфигурации из файла .env в обычный словарь: значения
+# передаются контроллеру напрямую, не попадая в окружение процесса
+# (и, как следствие, в окружение любых дочерних процессов)
+env = dotenv_values()
 
 def main():
     """
     Основная функция для запуска приложения.
     Инициализирует и запускает управляющий бот.
     """
+    _log_listener.start()
     try:
         logger.info("Запуск управляющего бота...")
-        controller_bot = ControllerBot()
+        controller_bot = ControllerBot(env=env)
         controller_bot.run()
     except Exception as e:
         logger.error(f"Ошибка при запуске приложения: {e}")
+    finally:
+        _log_listener.stop()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file